@@ -4,6 +4,7 @@ import platform
 import subprocess
 import anyio
 from website_mcp import compound_tool
+from react_template import create_react_project
 
 # Prompt given to the LLM before any build steps. It explains how to use the
 # available tools to generate or update files inside the sandbox. This helps
@@ -25,59 +26,151 @@ SYSTEM_PROMPT_REACT = (
 
 
 SPEC_PATH = os.path.join('docs', 'spec.md')
+# (mtime, contents) of the last spec read, reused while the file is unchanged
+_SPEC_CACHE: tuple[float, str] | None = None
 SITE_TYPES = ['html', 'react']
 
+# Output cap for the cheap planning call made before each refinement step.
+# Build steps are not capped: write_file arguments carry whole files.
+PLANNER_MAX_OUTPUT_TOKENS = 256
+PLANNER_PROMPT = (
+    "Do not call any tools and do not write code. Decide which files should be "
+    "changed in the next refinement step and reply with only their paths "
+    "relative to site-dir, one per line."
+)
+
+# Files refined concurrently by separate compound_tool calls when --parallel
+# is greater than one. Each call is told to touch only its own file.
+REFINE_TARGETS = ['index.html', 'css/style.css', 'js/main.js']
 
-def ensure_react_env() -> None:
+
+async def ensure_react_env() -> None:
     """Initialize a React project in site-dir if missing."""
     pkg = os.path.join('site-dir', 'package.json')
     if os.path.exists(pkg):
         return
     try:
-        subprocess.run(
-            ['npm', 'create', 'vite@latest', '.', '--', '--template', 'react'],
-            cwd='site-dir',
-            check=True,
-        )
-        subprocess.run(['npm', 'install'], cwd='site-dir', check=True)
+        # npm runs in a worker thread so the event loop stays responsive
+        await anyio.to_thread.run_sync(create_react_project, 'site-dir')
     except Exception:
         print('Warning: unable to set up React environment. Ensure Node.js is installed.')
 
-async def auto_build(iterations: int, model: str, site_type: str) -> None:
+def load_spec() -> str:
+    """Return the contents of SPEC_PATH, re-reading only when it changes."""
+    global _SPEC_CACHE
+    mtime = os.path.getmtime(SPEC_PATH)
+    if _SPEC_CACHE and _SPEC_CACHE[0] == mtime:
+        return _SPEC_CACHE[1]
+    with open(SPEC_PATH, 'r', encoding='utf-8') as fh:
+        data = fh.read()
+    _SPEC_CACHE = (mtime, data)
+    return data
+
+async def call_compound_tool(
+    messages: list[dict],
+    model: str,
+    max_output_tokens: int | None = None,
+    tools: bool = True,
+) -> str:
+    """Call compound_tool for one agent turn.
+
+    Timeouts and retries apply to each Groq request inside the turn (see
+    website_mcp.GROQ_TIMEOUT), so a retry never repeats the turn's writes.
+    """
+    return await compound_tool(
+        messages, model=model, max_output_tokens=max_output_tokens, tools=tools
+    )
+
+async def refine_parallel(messages: list[dict], model: str, parallel: int) -> str:
+    """Refine REFINE_TARGETS concurrently and return the merged replies."""
+    limiter = anyio.Semaphore(parallel)
+    results = [""] * len(REFINE_TARGETS)
+
+    async def refine(index: int, target: str) -> None:
+        sub_messages = messages + [
+            {
+                "role": "user",
+                "content": (
+                    f"Please refine the website. Only update {target}; other files are being refined separately. Replace it with an improved version."
+                ),
+            }
+        ]
+        async with limiter:
+            results[index] = await call_compound_tool(sub_messages, model)
+
+    async with anyio.create_task_group() as tg:
+        for index, target in enumerate(REFINE_TARGETS):
+            tg.start_soon(refine, index, target)
+    return "\n\n".join(
+        f"{target}:\n{text}" for target, text in zip(REFINE_TARGETS, results) if text
+    )
+
+async def plan_refinement(messages: list[dict], planner_model: str) -> str:
+    """Ask the cheap planner model which files the next step should touch.
+
+    No tools are offered, so the planner cannot write files or run commands.
+    """
+    plan_messages = messages + [{"role": "user", "content": PLANNER_PROMPT}]
+    return await call_compound_tool(
+        plan_messages,
+        planner_model,
+        max_output_tokens=PLANNER_MAX_OUTPUT_TOKENS,
+        tools=False,
+    )
+
+async def auto_build(
+    iterations: int,
+    model: str,
+    site_type: str,
+    parallel: int = 1,
+    planner_model: str | None = None,
+) -> None:
     """Run compound_tool repeatedly to incrementally build the site."""
     if iterations < 1:
         raise ValueError("iterations must be >= 1")
     if not os.path.exists(SPEC_PATH):
         raise FileNotFoundError(f"Spec file not found: {SPEC_PATH}")
-    with open(SPEC_PATH, 'r', encoding='utf-8') as fh:
-        spec = fh.read()
+    spec = load_spec()
 
     system = SYSTEM_PROMPT_REACT if site_type == "react" else SYSTEM_PROMPT
     if site_type == "react":
         print("OS:", platform.platform())
-        ensure_react_env()
+        await ensure_react_env()
     messages = [
         {"role": "system", "content": system},
         {"role": "user", "content": spec},
     ]
     for step in range(iterations):
-        if step > 0:
+        if step > 0 and parallel > 1 and site_type == "html":
+            result = await refine_parallel(messages, model, parallel)
             messages.append(
-                {
-                    "role": "user",
-                    "content": (
-                        "Please refine the website. Replace any older files with improved versions and add new code as needed."
-                    ),
-                }
+                {"role": "user", "content": "Please refine the website file by file."}
             )
-        result = await compound_tool(messages, model=model)
+        else:
+            if step > 0:
+                refine = (
+                    "Please refine the website. Replace any older files with improved versions and add new code as needed."
+                )
+                if planner_model:
+                    plan = (await plan_refinement(messages, planner_model)).strip()
+                    if plan:
+                        refine += f"\nModify only: {', '.join(plan.splitlines())}"
+                messages.append({"role": "user", "content": refine})
+            result = await call_compound_tool(messages, model)
         if result:
-            messages.append({"role": "assistant", "content": result[0]})
+            messages.append({"role": "assistant", "content": result})
         else:
             break
     if site_type == "react":
         try:
-            subprocess.run(["npm", "run", "build"], cwd="site-dir", check=True)
+            # Build output streams to the console, as npm errors explain failures
+            await anyio.run_process(
+                ["npm", "run", "build"],
+                cwd="site-dir",
+                stdin=subprocess.DEVNULL,
+                stdout=None,
+                stderr=None,
+            )
         except Exception as exc:
             print("React build failed:", exc)
         else:
@@ -88,5 +181,7 @@ if __name__ == "__main__":
     parser.add_argument("--iterations", type=int, default=3, help="Number of build steps to perform")
     parser.add_argument("--model", default="meta-llama/llama-4-maverick-17b-128e-instruct")
     parser.add_argument("--type", choices=SITE_TYPES, default="html", help="Project type: html or react")
+    parser.add_argument("--parallel", type=int, default=1, help="Concurrent per-file refinement calls for html sites (1 = sequential)")
+    parser.add_argument("--planner-model", default=None, help="Cheaper model that picks which files each refinement step should modify (e.g. llama-3.1-8b-instant)")
     args = parser.parse_args()
-    anyio.run(auto_build, args.iterations, args.model, args.type)
+    anyio.run(auto_build, args.iterations, args.model, args.type, args.parallel, args.planner_model)
@@ -1,63 +1,346 @@
 import os
 import json
+import functools
 import hashlib
-from typing import Dict, Any
+import stat
+import threading
+from typing import Dict, Any, Iterable
 
 try:
-    from sentence_transformers import SentenceTransformer
-except Exception as exc:
-    SentenceTransformer = None  # type: ignore
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    from blake3 import blake3 as _hasher
+except ImportError:
+    _hasher = hashlib.blake2b
 
 MODEL_NAME = os.environ.get("EMBED_MODEL", "paraphrase-MiniLM-L6-v2")
+# "onnx" runs the encoder with ONNX Runtime (exported on first use); any other
+# value keeps the default PyTorch backend.
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+ENCODE_BATCH_SIZE = 1024
+# Number of appended log entries after which the log is rewritten compactly
+COMPACT_EVERY = 256
+# Rows added to the vector matrix whenever it runs out of space
+VECTOR_GROW_ROWS = 1024
+
+
+def _json_default(obj: Any) -> Any:
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` to JSON bytes, using orjson when available."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_json_default).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _quantize(vectors: Any) -> tuple:
+    """Return int8 codes and per-row scales for a float matrix."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
 
 class EmbeddingManager:
     """Maintain embeddings for text files in a directory."""
 
     def __init__(self, root_dir: str) -> None:
         self.root_dir = os.path.abspath(root_dir)
-        self.index_path = os.path.join(self.root_dir, "embeddings.json")
-        self.model = None
-        if SentenceTransformer:
-            try:
-                self.model = SentenceTransformer(MODEL_NAME)
-            except Exception:
-                self.model = None
+        self.index_path = os.path.join(self.root_dir, "embeddings.log")
+        # Older versions rewrote a single JSON document on every change
+        self.legacy_index_path = os.path.join(self.root_dir, "embeddings.json")
+        self.vectors_path = os.path.join(self.root_dir, "vectors.npy")
+        self.vectors = None
         self.index: Dict[str, Dict[str, Any]] = {}
+        self._dirty_count = 0
+        # Paths queued by queue_update, embedded together by flush()
+        self._queued: Dict[str, None] = {}
+        self._queue_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
         self._load_index()
+        self._open_vectors()
+        self._migrate_inline_vectors()
 
-    def _load_index(self) -> None:
-        if os.path.exists(self.index_path):
+    @classmethod
+    @functools.lru_cache(maxsize=1)
+    def _get_model(cls):
+        """Load the shared SentenceTransformer on first use, or return None.
+
+        sentence-transformers pulls in torch and transformers, so it is only
+        imported here, the first time a file actually needs embedding.
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except Exception:
+            return None
+        if EMBED_BACKEND == "onnx":
             try:
-                with open(self.index_path, "r", encoding="utf-8") as fh:
-                    self.index = json.load(fh)
-            except (OSError, json.JSONDecodeError):
-                self.index = {}
+                return SentenceTransformer(MODEL_NAME, backend="onnx")
+            except Exception:
+                # Older sentence-transformers or missing onnxruntime/optimum
+                pass
+        try:
+            import torch
 
-    def _save_index(self) -> None:
+            torch.set_num_threads(os.cpu_count() or 4)
+        except ImportError:
+            pass
         try:
-            with open(self.index_path, "w", encoding="utf-8") as fh:
-                json.dump(self.index, fh)
+            return SentenceTransformer(MODEL_NAME)
+        except Exception:
+            return None
+
+    def _load_index(self) -> None:
+        """Replay the append-only log; the last entry for a path wins."""
+        if not os.path.exists(self.index_path):
+            self._load_legacy_index()
+            return
+        try:
+            with open(self.index_path, "rb") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = _loads(line)
+                    except ValueError:
+                        # A torn final write only loses that one entry
+                        continue
+                    path = entry.pop("path", None)
+                    if path:
+                        self.index[path] = entry
         except OSError:
-            pass
+            self.index = {}
 
-    def update_file(self, rel_path: str) -> None:
-        """Update embedding for a file if changed."""
-        if not self.model:
+    def _load_legacy_index(self) -> None:
+        if not os.path.exists(self.legacy_index_path):
             return
-        full_path = os.path.abspath(os.path.join(self.root_dir, rel_path))
-        if not full_path.startswith(self.root_dir):
+        try:
+            with open(self.legacy_index_path, "rb") as fh:
+                self.index = _loads(fh.read())
+        except (OSError, ValueError):
+            self.index = {}
             return
-        if not os.path.isfile(full_path):
+        self._compact()
+
+    def _open_vectors(self) -> None:
+        """Memory-map the int8 vector matrix if it exists."""
+        if np is None or not os.path.exists(self.vectors_path):
             return
         try:
-            with open(full_path, "r", encoding="utf-8") as fh:
-                text = fh.read()
-        except OSError:
+            self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+        except (OSError, ValueError):
+            self._reset_vectors()
             return
-        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if self.vectors.dtype != np.int8:
+            self._requantize_vectors()
+
+    def _requantize_vectors(self) -> None:
+        """Convert a float16 matrix written by older versions to int8."""
+        paths = [p for p, info in self.index.items() if "row" in info]
+        rows = [self.index[p]["row"] for p in paths]
+        old = np.asarray(self.vectors[rows], dtype=np.float32)
+        self.vectors = None
+        for rel_path in paths:
+            del self.index[rel_path]["row"]
+        try:
+            os.remove(self.vectors_path)
+            if paths:
+                self._store_vectors(paths, old)
+        except (OSError, ValueError):
+            self._reset_vectors()
+            return
+        self._compact()
+
+    def _reset_vectors(self) -> None:
+        """Drop the vector matrix so every file is re-embedded on next update."""
+        self.vectors = None
+        for info in self.index.values():
+            for key in ("row", "hash", "mtime_ns", "size"):
+                info.pop(key, None)
+        # Persist the reset; otherwise stale rows come back from the log on reload
+        self._compact()
+
+    def _next_row(self) -> int:
+        rows = [info["row"] for info in self.index.values() if "row" in info]
+        return max(rows) + 1 if rows else 0
+
+    def _reserve_rows(self, count: int, dim: int) -> int:
+        """Return the first of ``count`` free rows, growing the matrix if needed."""
+        start = self._next_row()
+        needed = start + count
+        if self.vectors is None or self.vectors.shape[0] < needed:
+            capacity = -(-needed // VECTOR_GROW_ROWS) * VECTOR_GROW_ROWS
+            tmp_path = self.vectors_path + ".tmp.npy"
+            grown = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.int8, shape=(capacity, dim)
+            )
+            if self.vectors is not None:
+                grown[: self.vectors.shape[0]] = self.vectors
+            grown.flush()
+            del grown
+            self.vectors = None
+            os.replace(tmp_path, self.vectors_path)
+            self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+        return start
+
+    def _store_vectors(self, rel_paths: list, vectors: Any) -> None:
+        """Quantize ``vectors`` into rows reused or reserved for ``rel_paths``."""
+        codes, scales = _quantize(vectors)
+        if self.vectors is not None and self.vectors.shape[1] != codes.shape[1]:
+            # The embedding model changed; start a fresh matrix
+            self._reset_vectors()
+        new_paths = [p for p in rel_paths if "row" not in self.index.get(p, {})]
+        start = self._reserve_rows(len(new_paths), codes.shape[1])
+        for offset, rel_path in enumerate(new_paths):
+            self.index.setdefault(rel_path, {})["row"] = start + offset
+        for rel_path, code, scale in zip(rel_paths, codes, scales):
+            info = self.index[rel_path]
+            self.vectors[info["row"]] = code
+            info["scale"] = float(scale)
+        self.vectors.flush()
+
+    def get_vector(self, rel_path: str) -> Any:
+        """Return the dequantized float32 embedding for a file, or None."""
         info = self.index.get(rel_path)
-        if info and info.get("hash") == digest:
+        if self.vectors is None or not info or "row" not in info:
+            return None
+        return self.vectors[info["row"]].astype(np.float32) * info.get("scale", 1.0)
+
+    def _migrate_inline_vectors(self) -> None:
+        """Move vectors stored inline by older versions into the matrix."""
+        inline = [p for p, info in self.index.items() if "vector" in info]
+        if not inline or np is None:
+            return
+        try:
+            self._store_vectors(inline, [self.index[p].pop("vector") for p in inline])
+        except (OSError, ValueError):
+            for rel_path in inline:
+                self.index[rel_path].pop("hash", None)
+            return
+        self._compact()
+
+    def _append_entries(self, rel_paths: Iterable[str]) -> None:
+        """Append the current index entries for ``rel_paths`` to the log."""
+        count = 0
+        try:
+            with open(self.index_path, "ab") as fh:
+                for rel_path in rel_paths:
+                    info = self.index[rel_path]
+                    fh.write(_dumps({"path": rel_path, **info}) + b"\n")
+                    count += 1
+                fh.flush()
+        except OSError:
             return
-        vector = self.model.encode([text])[0].tolist()
-        self.index[rel_path] = {"hash": digest, "vector": vector}
-        self._save_index()
+        self._dirty_count += count
+        if self._dirty_count >= COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Atomically rewrite the log with one entry per indexed path."""
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as fh:
+                for rel_path, info in self.index.items():
+                    fh.write(_dumps({"path": rel_path, **info}) + b"\n")
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            return
+        self._dirty_count = 0
+
+    def update_file(self, rel_path: str) -> None:
+        """Update embedding for a file if changed."""
+        self.update_files([rel_path])
+
+    def queue_update(self, rel_path: str) -> None:
+        """Remember ``rel_path`` for the next :meth:`flush`."""
+        with self._queue_lock:
+            self._queued[rel_path] = None
+
+    def flush(self) -> None:
+        """Embed every queued file with a single batched encode call.
+
+        Safe to call from a worker thread while other threads keep queueing.
+        """
+        with self._flush_lock:
+            with self._queue_lock:
+                rel_paths, self._queued = list(self._queued), {}
+            if rel_paths:
+                self.update_files(rel_paths)
+
+    def update_files(self, rel_paths: Iterable[str]) -> None:
+        """Update embeddings for several files with a single encode call."""
+        pending = []
+        touched = []
+        for rel_path in rel_paths:
+            full_path = os.path.abspath(os.path.join(self.root_dir, rel_path))
+            if not full_path.startswith(self.root_dir):
+                continue
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            info = self.index.get(rel_path)
+            if (
+                info
+                and info.get("mtime_ns") == st.st_mtime_ns
+                and info.get("size") == st.st_size
+            ):
+                continue
+            try:
+                with open(full_path, "rb") as fh:
+                    raw = fh.read()
+            except OSError:
+                continue
+            digest = _hasher(raw).hexdigest()
+            if info and info.get("hash") == digest:
+                # Touched but unchanged (e.g. an editor re-save): refresh stat only
+                info["mtime_ns"] = st.st_mtime_ns
+                info["size"] = st.st_size
+                touched.append(rel_path)
+                continue
+            try:
+                text = raw.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+            pending.append((rel_path, st, digest, text))
+        model = self._get_model() if pending else None
+        if model:
+            vectors = model.encode(
+                [text for _, _, _, text in pending],
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            try:
+                self._store_vectors([rel_path for rel_path, _, _, _ in pending], vectors)
+            except (OSError, ValueError):
+                pending = []
+            for rel_path, st, digest, _ in pending:
+                self.index[rel_path].update(
+                    hash=digest, mtime_ns=st.st_mtime_ns, size=st.st_size
+                )
+                touched.append(rel_path)
+        if touched:
+            self._append_entries(touched)
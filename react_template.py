@@ -0,0 +1,71 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+# Pre-initialized Vite React projects are archived here after the first
+# scaffold so later projects can skip the registry round trip.
+CACHE_DIR = os.environ.get(
+    "WEB_BUILD_AI_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "web-build-ai"),
+)
+TEMPLATE_ARCHIVE = os.path.join(CACHE_DIR, "react_template.tar.gz")
+# A template may also be shipped next to the scripts
+BUNDLED_ARCHIVE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "react_template.tar.gz"
+)
+
+
+# Characters of a failed command's stderr kept in the raised error
+STDERR_TAIL_CHARS = 2000
+
+
+def _run(cmd: list[str], cwd: str) -> None:
+    try:
+        subprocess.run(
+            cmd, cwd=cwd, stdin=subprocess.DEVNULL, check=True, capture_output=True
+        )
+    except subprocess.CalledProcessError as exc:
+        # npm explains failures on stderr; keep its tail for the caller
+        tail = (exc.stderr or b"").decode("utf-8", "replace")[-STDERR_TAIL_CHARS:]
+        raise RuntimeError(f"{exc}\n{tail.strip()}".rstrip()) from exc
+
+
+def _scaffold_template() -> str:
+    """Create the Vite React template once and archive it in CACHE_DIR."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        _run(
+            [
+                "npm",
+                "exec",
+                "--yes",
+                "create-vite@latest",
+                ".",
+                "--",
+                "--template",
+                "react",
+            ],
+            cwd=tmp,
+        )
+        base = os.path.join(CACHE_DIR, "react_template.tmp")
+        archive = shutil.make_archive(base, "gztar", root_dir=tmp)
+        os.replace(archive, TEMPLATE_ARCHIVE)
+    return TEMPLATE_ARCHIVE
+
+
+def create_react_project(site_dir: str) -> None:
+    """Initialize a React project in ``site_dir`` from the cached template.
+
+    Raises ``OSError`` or, when npm fails, ``RuntimeError`` carrying the tail of
+    its stderr.
+    """
+    if os.path.exists(BUNDLED_ARCHIVE):
+        archive = BUNDLED_ARCHIVE
+    elif os.path.exists(TEMPLATE_ARCHIVE):
+        archive = TEMPLATE_ARCHIVE
+    else:
+        archive = _scaffold_template()
+    os.makedirs(site_dir, exist_ok=True)
+    shutil.unpack_archive(archive, site_dir)
+    _run(["npm", "install", "--prefer-offline", "--no-audit", "--no-fund"], cwd=site_dir)
@@ -1,79 +1,131 @@
 import os
 import sys
+import asyncio
+import queue
+import threading
 import subprocess
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, filedialog
 import shutil
-import re
-import anyio
+import contextlib
+import atexit
+import signal
+import codecs
+import hashlib
+import functools
+import glob
+import random
 import webbrowser
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-from mcp.client.session_group import ClientSessionGroup, SseServerParameters
+from react_template import create_react_project
+
+# anyio, httpx and the MCP client are imported on first use, from the MCP
+# loop thread, so they do not delay the first paint of the window.
+
+# Load environment variables from a .env file if present so the UI and
+# MCP server both have access to API keys without requiring them to be
+# exported globally.
+load_dotenv()
 
 MCP_PORT = 4876
 MCP_URL = f"http://localhost:{MCP_PORT}/sse"
 UPLOAD_DIR = os.path.join("site-dir", "uploads")
 DOCS_DIR = os.path.join("site-dir", "docs")
 DEV_SERVER_PORT = 5173
+# Optional file that collects the MCP and Vite servers' output
+SERVER_LOG = os.getenv("WEB_BUILD_AI_SERVER_LOG")
+# Characters of each guideline doc included in the build prompt
+DOC_SNIPPET_CHARS = 2000
+# Shared pool for copying uploads and reading docs, reused across Runs
+_io_pool = ThreadPoolExecutor(max_workers=8)
 vite_process: subprocess.Popen | None = None
 
 
+def _nvm_dir() -> str:
+    return os.environ.get("NVM_DIR") or os.path.expanduser("~/.nvm")
+
+
+def _nvm_node_bin(min_major: int) -> str | None:
+    """Return the bin dir of the newest nvm-installed Node >= ``min_major``."""
+    best: tuple[int, ...] = ()
+    best_bin = None
+    for path in glob.glob(os.path.join(_nvm_dir(), "versions", "node", "v*", "bin")):
+        name = os.path.basename(os.path.dirname(path))
+        try:
+            ver = tuple(int(p) for p in name.lstrip("v").split("."))
+        except ValueError:
+            continue
+        if ver[0] >= min_major and ver > best:
+            best, best_bin = ver, path
+    return best_bin
+
+
+@functools.lru_cache(maxsize=4)
 def ensure_nodejs(min_major: int = 20) -> bool:
-    """Install Node.js via nvm if missing and return True if available."""
+    """Install Node.js via nvm if missing and return True if available.
+
+    The result is cached for the lifetime of the process.
+    """
     if check_node_version(min_major):
         return True
     try:
-        # Install nvm if it's not already present
-        if subprocess.run("command -v nvm", shell=True).returncode != 0:
+        node_bin = _nvm_node_bin(min_major)
+        if node_bin is None:
+            # nvm is a shell function, so look for its script rather than
+            # probing with "command -v"
+            nvm_sh = os.path.join(_nvm_dir(), "nvm.sh")
+            if not os.path.exists(nvm_sh):
+                subprocess.run(
+                    "curl -o- https://raw.githubusercontent.com/nvm-sh/nvm/v0.39.7/install.sh | bash",
+                    shell=True,
+                    stdin=subprocess.DEVNULL,
+                    check=True,
+                )
+            # Install the required Node version
             subprocess.run(
-                "curl -o- https://raw.githubusercontent.com/nvm-sh/nvm/v0.39.7/install.sh | bash",
-                shell=True,
+                ["bash", "-c", f'source "{nvm_sh}" && nvm install {min_major}'],
+                stdin=subprocess.DEVNULL,
                 check=True,
             )
-        # Install and activate the required Node version
-        subprocess.run(
-            [
-                "bash",
-                "-c",
-                f"source $HOME/.nvm/nvm.sh && nvm install {min_major} && nvm use {min_major}",
-            ],
-            check=True,
-        )
+            node_bin = _nvm_node_bin(min_major)
+            if node_bin is None:
+                return False
         # Update PATH for the current process
-        node_bin = (
-            subprocess.check_output(
-                [
-                    "bash",
-                    "-c",
-                    f"source $HOME/.nvm/nvm.sh && nvm which {min_major}",
-                ]
-            )
-            .decode()
-            .strip()
-        )
-        os.environ["PATH"] = (
-            os.path.dirname(node_bin) + os.pathsep + os.environ.get("PATH", "")
-        )
+        os.environ["PATH"] = node_bin + os.pathsep + os.environ.get("PATH", "")
+        _invalidate_node_cache()
     except Exception:
         return False
     return check_node_version(min_major)
 
 
-def check_node_version(min_major: int = 20) -> bool:
-    """Return True if the installed Node.js meets the required major version."""
+@functools.lru_cache(maxsize=1)
+def _detect_node_major() -> int | None:
+    """Return the major version of ``node`` on PATH, probing only once."""
     try:
         out = subprocess.run(
             ["node", "--version"],
+            stdin=subprocess.DEVNULL,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
             check=True,
         )
         ver = out.stdout.strip().lstrip("v")
-        major = int(ver.split(".")[0])
+        return int(ver.split(".")[0])
     except (FileNotFoundError, ValueError, subprocess.CalledProcessError):
-        return False
-    return major >= min_major
+        return None
+
+
+def _invalidate_node_cache() -> None:
+    """Forget the detected Node version, e.g. after PATH changes."""
+    _detect_node_major.cache_clear()
+
+
+def check_node_version(min_major: int = 20) -> bool:
+    """Return True if the installed Node.js meets the required major version."""
+    major = _detect_node_major()
+    return major is not None and major >= min_major
 
 
 # System prompt explaining how to use the available tools. This is inserted
@@ -92,11 +144,6 @@ SYSTEM_PROMPT_REACT = (
     "components in site-dir/src and run npm scripts with run_cmd when needed."
 )
 
-# Load environment variables from a .env file if present so the UI and
-# MCP server both have access to API keys without requiring them to be
-# exported globally.
-load_dotenv()
-
 # Lists of available models sorted by release date (latest first). Only Groq
 # and Gemini models are included here.
 GROQ_MODEL_OPTIONS = [
@@ -127,9 +174,32 @@ GEMINI_MODEL_OPTIONS = [
 ]
 
 DEFAULT_MODEL_ENV = os.getenv("MCP_MODEL")
+# Optional cheaper model used for short chat tweaks such as "make header blue"
+PLANNER_MODEL = os.getenv("MCP_PLANNER_MODEL")
+SHORT_CHAT_CHARS = 80
 current_model = ""
 MODEL_OPTIONS: list[str] = []
 SPEC_FILE = os.path.join("docs", "spec.md")
+# (mtime, contents) of the last spec read, reused while the file is unchanged
+_SPEC_CACHE: tuple[float, str] | None = None
+
+# Single-line spec fields: header -> field. The value is the rest of the
+# header line, or the next non-blank line when the header ends its line.
+_SPEC_FIELDS = {
+    "Business name:": "name",
+    "Proposed tagline:": "tagline",
+    "Overall vibe:": "style",
+}
+# Multi-line spec sections: header -> (field, terminators). A section runs
+# until the first later line starting with a terminator, or to the end.
+_SPEC_SECTIONS = {
+    "Color scheme:": (
+        "colors",
+        ("Follow", "Additional", "Accessibility", "Performance"),
+    ),
+    "Structure & key pages": ("desc", ("Responsive grid", "Design style:")),
+    "Additional instructions:": ("extra", ()),
+}
 
 # Supported project types
 SITE_TYPES = ["html", "react"]
@@ -138,130 +208,395 @@ current_site_type = "html"
 # conversation history for revision prompts
 conversation: list[dict] = []
 
+# Bounds for opening the MCP session. A failed connect is retried with
+# exponential backoff; the compound_tool call itself is not, since the turn
+# may already have written files. The server bounds each Groq request.
+CONNECT_TIMEOUT = 30
+MAX_RETRIES = 3
+
+
+@functools.lru_cache(maxsize=1)
+def retryable_errors() -> tuple[type[BaseException], ...]:
+    """Return the exceptions that make an MCP connect worth retrying."""
+    import anyio
+    import httpx
+
+    return (
+        TimeoutError,
+        OSError,
+        httpx.HTTPError,
+        anyio.BrokenResourceError,
+        anyio.ClosedResourceError,
+    )
 
-async def call_compound_tool(prompt: str, site_type: str) -> str:
-    """Send the next user prompt using the conversation history."""
+
+class MCPClient:
+    """Run MCP calls on a background event loop with one persistent session.
+
+    Tk callbacks submit coroutines with ``submit`` instead of starting a new
+    event loop per click, so the SSE connection to the server is opened once
+    and reused for every prompt.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.loop = asyncio.new_event_loop()
+        self._ready: asyncio.Future | None = None
+        self._stop: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._thread = threading.Thread(
+            target=self._run_loop, name="mcp-client", daemon=True
+        )
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            # Runs once close() stops the loop; finish async generators and
+            # release the loop's selector and executor.
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    async def _hold_session(self, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        """Keep a connected session open until ``stop`` is set."""
+        try:
+            from mcp.client.session_group import (
+                ClientSessionGroup,
+                SseServerParameters,
+            )
+
+            async with ClientSessionGroup() as group:
+                session = await group.connect_to_server(SseServerParameters(url=self.url))
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as exc:
+            if not ready.done():
+                ready.set_exception(exc)
+        finally:
+            # If the connection dropped on its own, let the next call reconnect
+            # instead of handing out a dead session.
+            if self._ready is ready:
+                self._ready = None
+                self._stop = None
+
+    async def get_session(self):
+        """Return the shared session, connecting on first use."""
+        if self._ready is None:
+            self._ready = self.loop.create_future()
+            self._stop = asyncio.Event()
+            self._task = self.loop.create_task(
+                self._hold_session(self._ready, self._stop)
+            )
+        return await asyncio.shield(self._ready)
+
+    def reset(self) -> None:
+        """Drop the current session so the next call reconnects."""
+        if self._stop is not None:
+            self._stop.set()
+        self._ready = None
+        self._stop = None
+
+    def submit(self, coro) -> Future:
+        """Schedule ``coro`` on the background loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _shutdown(self) -> None:
+        task = self._task
+        self.reset()
+        if task is not None:
+            await asyncio.wait([task], timeout=5)
+
+    def close(self) -> None:
+        """Disconnect the session and stop the background loop."""
+        try:
+            self.submit(self._shutdown()).result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+mcp_client: MCPClient | None = None
+
+# Progress messages from the server (e.g. "write_file index.html"), filled on
+# the MCP loop thread and drained by the Tk thread.
+progress_updates: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+
+
+async def report_progress(
+    progress: float, total: float | None, message: str | None
+) -> None:
+    if message:
+        progress_updates.put(message)
+
+
+async def request_compound_tool(messages: list[dict], model: str = "") -> str:
+    """Call compound_tool over MCP, retrying only the session connect."""
+    import anyio
+
+    model = model or current_model
+    for attempt in range(MAX_RETRIES):
+        try:
+            with anyio.fail_after(CONNECT_TIMEOUT):
+                session = await mcp_client.get_session()
+            break
+        except retryable_errors():
+            mcp_client.reset()
+            if attempt == MAX_RETRIES - 1:
+                raise
+            await anyio.sleep(2 ** attempt + random.random())
+    try:
+        result = await session.call_tool(
+            "compound_tool",
+            {"messages": messages, "model": model},
+            progress_callback=report_progress,
+        )
+    except retryable_errors():
+        # Reconnect on the next request; the turn itself is not repeated
+        mcp_client.reset()
+        raise
+    text_blocks = [b.text for b in result.content if hasattr(b, "text")]
+    return "".join(text_blocks) if text_blocks else ""
+
+
+def _ensure_system(site_type: str) -> None:
+    """Start the conversation with the system prompt for ``site_type``."""
     if not conversation:
         system = SYSTEM_PROMPT_REACT if site_type == "react" else SYSTEM_PROMPT
         conversation.append({"role": "system", "content": system})
+
+
+async def _one_turn(extra_user: str | None = None, model: str = "") -> str:
+    """Optionally add a user message, then record the assistant's reply."""
+    if extra_user:
+        conversation.append({"role": "user", "content": extra_user})
+    text = await request_compound_tool(conversation, model)
+    conversation.append({"role": "assistant", "content": text})
+    return text
+
+
+async def call_compound_tool(prompt: str, site_type: str) -> str:
+    """Send the next user prompt using the conversation history."""
+    _ensure_system(site_type)
     conversation.append({"role": "user", "content": prompt})
+    extra = None
     if len(conversation) > 2:
-        conversation.append(
-            {
-                "role": "user",
-                "content": "Please improve the site. Replace outdated files with enhanced versions and add new code where useful.",
-            }
-        )
-    async with ClientSessionGroup() as group:
-        session = await group.connect_to_server(SseServerParameters(url=MCP_URL))
-        result = await session.call_tool(
-            "compound_tool", {"messages": conversation, "model": current_model}
-        )
-        text_blocks = [b.text for b in result.content if hasattr(b, "text")]
-        text = "".join(text_blocks) if text_blocks else ""
-        conversation.append({"role": "assistant", "content": text})
-        return text
+        extra = "Please improve the site. Replace outdated files with enhanced versions and add new code where useful."
+    model = PLANNER_MODEL if PLANNER_MODEL and len(prompt) <= SHORT_CHAT_CHARS else ""
+    return await _one_turn(extra, model)
 
 
 async def auto_build(prompt: str, iterations: int, site_type: str) -> None:
     """Run multiple build steps automatically using the MCP server."""
     if iterations < 1:
         raise ValueError("Build steps must be at least 1")
-    if not conversation:
-        system = SYSTEM_PROMPT_REACT if site_type == "react" else SYSTEM_PROMPT
-        conversation.append({"role": "system", "content": system})
+    _ensure_system(site_type)
     conversation.append({"role": "user", "content": prompt})
-    async with ClientSessionGroup() as group:
-        session = await group.connect_to_server(SseServerParameters(url=MCP_URL))
-        for step in range(iterations):
-            if step > 0:
-                conversation.append(
-                    {
-                        "role": "user",
-                        "content": "Please improve the site by updating existing files with better code and adding new sections if helpful.",
-                    }
-                )
-            result = await session.call_tool(
-                "compound_tool", {"messages": conversation, "model": current_model}
-            )
-            text_blocks = [b.text for b in result.content if hasattr(b, "text")]
-            text = "".join(text_blocks) if text_blocks else ""
-            conversation.append({"role": "assistant", "content": text})
+    for step in range(iterations):
+        extra = None
+        if step > 0:
+            extra = "Please improve the site by updating existing files with better code and adding new sections if helpful."
+        await _one_turn(extra)
+
+
+def content_key(path: str, sample: int = 65536) -> str:
+    """Return a fast content key from the size, mtime and ends of a file."""
+    st = os.stat(path)
+    h = hashlib.blake2b(digest_size=8)
+    h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, "rb") as fh:
+        h.update(fh.read(sample))
+        if st.st_size > sample:
+            fh.seek(max(sample, st.st_size - sample))
+            h.update(fh.read(sample))
+    return h.hexdigest()
+
+
+def copy_upload(src: str, dst: str) -> None:
+    """Copy ``src`` to ``dst``, recreating the destination folder if needed.
+
+    Uploads are never hard-linked: run_cmd executes arbitrary commands in the
+    sandbox and an in-place edit there must not reach the user's original.
+    """
+    try:
+        shutil.copyfile(src, dst)
+    except FileNotFoundError:
+        parent = os.path.dirname(dst)
+        if os.path.isdir(parent):
+            raise
+        os.makedirs(parent, exist_ok=True)
+        shutil.copyfile(src, dst)
+
+
+def store_image(path: str) -> str:
+    """Place an image in UPLOAD_DIR under a content-keyed name and return it.
+
+    Re-running with unchanged images finds the existing file and skips the copy.
+    """
+    stem, ext = os.path.splitext(os.path.basename(path))
+    name = f"{stem}-{content_key(path)}{ext}"
+    dst = os.path.join(UPLOAD_DIR, name)
+    if not os.path.exists(dst):
+        copy_upload(path, dst)
+    return name
+
+
+def _needs_copy(src: str, dst: str) -> bool:
+    """Return True unless ``dst`` is ``src`` or an up-to-date copy of it."""
+    try:
+        s, d = os.stat(src), os.stat(dst)
+    except FileNotFoundError:
+        return True
+    if os.path.samestat(s, d):
+        return False
+    return s.st_size != d.st_size or s.st_mtime_ns > d.st_mtime_ns
+
+
+def store_doc(path: str) -> None:
+    """Place a guideline doc in DOCS_DIR under its own name.
+
+    Docs keep their names so search_docs never sees stale versions.
+    """
+    dst = os.path.join(DOCS_DIR, os.path.basename(path))
+    if not _needs_copy(path, dst):
+        return
+    if os.path.lexists(dst):
+        os.remove(dst)
+    copy_upload(path, dst)
+
+
+@functools.lru_cache(maxsize=128)
+def _read_doc_snippet(path: str, mtime_ns: int, size: int) -> str:
+    # mtime_ns and size are only part of the cache key. Each byte decodes to
+    # at most one character, so reading the number still missing never
+    # overshoots; plain ASCII docs need a single DOC_SNIPPET_CHARS-byte read.
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    text = ""
+    with open(path, "rb") as fh:
+        while len(text) < DOC_SNIPPET_CHARS:
+            chunk = fh.read(DOC_SNIPPET_CHARS - len(text))
+            if not chunk:
+                text += decoder.decode(b"", final=True)
+                break
+            text += decoder.decode(chunk)
+    return text[:DOC_SNIPPET_CHARS]
+
+
+def read_doc_snippet(path: str) -> str:
+    """Return the first DOC_SNIPPET_CHARS characters of a text file.
+
+    Only about as many bytes as characters are read, so large docs are never
+    loaded whole. Results are cached until the file's
+    mtime or size changes.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return _read_doc_snippet(path, st.st_mtime_ns, st.st_size)
+
+
+def load_spec() -> str:
+    """Return the contents of SPEC_FILE, re-reading only when it changes."""
+    global _SPEC_CACHE
+    mtime = os.path.getmtime(SPEC_FILE)
+    if _SPEC_CACHE and _SPEC_CACHE[0] == mtime:
+        return _SPEC_CACHE[1]
+    with open(SPEC_FILE, "r", encoding="utf-8") as fh:
+        data = fh.read()
+    _SPEC_CACHE = (mtime, data)
+    return data
+
+
+def parse_spec_text(text: str) -> dict[str, str]:
+    """Extract spec fields from ``text`` in a single pass over its lines.
+
+    Only the first occurrence of each header is used, matching the fields
+    listed in _SPEC_FIELDS and _SPEC_SECTIONS.
+    """
+    values: dict[str, str] = {}
+    waiting: list[str] = []
+    sections: dict[str, tuple[list[str], tuple[str, ...]]] = {}
+    for line in text.split("\n"):
+        for field, (buf, terminators) in list(sections.items()):
+            if terminators and line.startswith(terminators):
+                values[field] = "\n".join(buf)
+                del sections[field]
+            else:
+                buf.append(line)
+        if waiting and line.strip():
+            for field in waiting:
+                values[field] = line.strip()
+            waiting = []
+        for header, field in _SPEC_FIELDS.items():
+            if field in values or field in waiting:
+                continue
+            pos = line.find(header)
+            if pos != -1:
+                rest = line[pos + len(header):].strip()
+                if rest:
+                    values[field] = rest
+                else:
+                    waiting.append(field)
+        for header, (field, terminators) in _SPEC_SECTIONS.items():
+            if field in values or field in sections:
+                continue
+            pos = line.find(header)
+            if pos != -1:
+                sections[field] = ([line[pos + len(header):]], terminators)
+    for field, (buf, _) in sections.items():
+        values[field] = "\n".join(buf)
+    return values
 
 
 def parse_spec_file():
     """Read docs/spec.md and return parsed fields."""
     if not os.path.exists(SPEC_FILE):
         raise FileNotFoundError(SPEC_FILE)
-    with open(SPEC_FILE, "r", encoding="utf-8") as fh:
-        text = fh.read()
-    name = ""
-    style = ""
-    colors = ""
-    desc = text
-    extra = ""
-    m = re.search(r"Business name:\s*(.+)", text)
-    if m:
-        name = m.group(1).strip()
-    m = re.search(r"Proposed tagline:\s*(.+)", text)
-    tagline = m.group(1).strip() if m else ""
-    m = re.search(r"Overall vibe:\s*(.+)", text)
-    if m:
-        style = m.group(1).strip()
-    m = re.search(
-        r"Color scheme:(.*?)(?:\nFollow|\nAdditional|\nAccessibility|\nPerformance|$)",
-        text,
-        re.S,
-    )
-    if m:
-        colors = " ".join(
-            line.strip() for line in m.group(1).splitlines() if line.strip()
-        )
-    m = re.search(
-        r"Structure & key pages(.*?)(?:\nResponsive grid|\nDesign style:|$)", text, re.S
+    text = load_spec()
+    fields = parse_spec_text(text)
+    name = fields.get("name", "")
+    style = fields.get("style", "")
+    tagline = fields.get("tagline", "")
+    colors = " ".join(
+        line.strip() for line in fields.get("colors", "").splitlines() if line.strip()
     )
-    if m:
-        desc = m.group(1).strip()
+    desc = fields["desc"].strip() if "desc" in fields else text
     if tagline:
         desc = f"Proposed tagline: {tagline}\n\n" + desc
-    m = re.search(r"Additional instructions:(.*)", text, re.S)
-    if m:
-        extra = m.group(1).strip()
+    extra = fields.get("extra", "").strip()
     return name, style, colors, desc, extra
 
 
-def ensure_react_env() -> None:
-    """Create a basic React project inside site-dir if missing."""
+def setup_react_env() -> tuple[str, str] | None:
+    """Create a basic React project inside site-dir if missing.
+
+    Safe to call off the Tk thread; returns a ``(title, message)`` warning on
+    failure instead of showing it.
+    """
     if not ensure_nodejs():
-        messagebox.showwarning(
+        return (
             "Node.js required",
             "Node.js 20 or newer is required to run the React dev server.",
         )
-        return
     pkg_json = os.path.join("site-dir", "package.json")
     if os.path.exists(pkg_json):
-        return
+        return None
     try:
-        subprocess.run(
-            [
-                "npm",
-                "exec",
-                "--yes",
-                "create-vite@latest",
-                ".",
-                "--",
-                "--template",
-                "react",
-            ],
-            cwd="site-dir",
-            check=True,
-        )
-        subprocess.run(["npm", "install"], cwd="site-dir", check=True)
+        create_react_project("site-dir")
     except Exception:
-        messagebox.showwarning(
+        return (
             "React setup failed",
             "Could not initialize React environment. Ensure Node.js and npm are installed.",
         )
+    return None
+
+
+async def prepare_site(site_t: str) -> tuple[str, str] | None:
+    """Set up the React project in a worker thread when ``site_t`` needs it."""
+    if site_t != "react":
+        return None
+    return await asyncio.to_thread(setup_react_env)
 
 
 def start_vite_server() -> None:
@@ -276,12 +611,18 @@ def start_vite_server() -> None:
         )
         return
     try:
-        vite_process = subprocess.Popen(
-            ["npm", "run", "dev"],
-            cwd="site-dir",
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+        with server_output() as log:
+            vite_process = subprocess.Popen(
+                ["npm", "run", "dev"],
+                cwd="site-dir",
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                # Keep Ctrl-C in the launcher's terminal away from the dev server
+                start_new_session=True,
+            )
+        # Its own session outlives the UI, so stop it however we exit
+        atexit.register(stop_process, vite_process)
     except Exception:
         messagebox.showwarning(
             "Vite failed",
@@ -289,26 +630,67 @@ def start_vite_server() -> None:
         )
 
 
+@contextlib.contextmanager
+def server_output():
+    """Yield the stdout/stderr target for the dev and MCP servers.
+
+    Output is discarded unless SERVER_LOG names a file to append to; the
+    child keeps its own handle after the block exits.
+    """
+    if SERVER_LOG:
+        with open(SERVER_LOG, "ab") as fh:
+            yield fh
+    else:
+        yield subprocess.DEVNULL
+
+
+def stop_process(proc: subprocess.Popen) -> None:
+    """Terminate ``proc`` and, on POSIX, the session it leads."""
+    if proc.poll() is not None:
+        return
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            return
+        except OSError:
+            pass
+    proc.terminate()
+
+
 def start_server() -> subprocess.Popen:
-    return subprocess.Popen(
-        [
-            sys.executable,
-            "website_mcp.py",
-            "--port",
-            str(MCP_PORT),
-            "--transport",
-            "sse",
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    with server_output() as log:
+        proc = subprocess.Popen(
+            [
+                sys.executable,
+                "website_mcp.py",
+                "--port",
+                str(MCP_PORT),
+                "--transport",
+                "sse",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+    # A stale server would keep the port and answer the next launch
+    atexit.register(stop_process, proc)
+    return proc
+
+
+def _exit_on_signal(signum, frame) -> None:
+    # Turn SIGTERM/SIGHUP into a normal exit so the atexit hooks run
+    sys.exit(128 + signum)
 
 
 def main():
+    # Created once here; copy_upload recreates them if site-dir is removed
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(DOCS_DIR, exist_ok=True)
     groq_key = os.getenv("GROQ_API_KEY")
     gemini_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
 
-    global MODEL_OPTIONS, current_model
+    global MODEL_OPTIONS, current_model, mcp_client
     MODEL_OPTIONS = []
     if groq_key:
         MODEL_OPTIONS.extend(GROQ_MODEL_OPTIONS)
@@ -327,7 +709,11 @@ def main():
     default_model = DEFAULT_MODEL_ENV or MODEL_OPTIONS[0]
     current_model = default_model
 
+    for name in ("SIGTERM", "SIGHUP"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), _exit_on_signal)
     server = start_server()
+    mcp_client = MCPClient(MCP_URL)
     root = tk.Tk()
     root.title("Website Builder")
     root.geometry("1000x700")
@@ -393,12 +779,14 @@ def main():
     img_list.pack(fill="both", expand=True)
 
     image_paths: list[str] = []
+    image_paths_set: set[str] = set()
 
     tk.Label(scroll_frame, text="Guideline docs:").pack(anchor="w")
     doc_list = tk.Listbox(scroll_frame, width=60, height=4)
     doc_list.pack(fill="both", expand=True)
 
     doc_paths: list[str] = []
+    doc_paths_set: set[str] = set()
 
     def fill_from_spec():
         try:
@@ -419,20 +807,24 @@ def main():
 
     def add_images():
         paths = filedialog.askopenfilenames(title="Select images")
-        for p in paths:
-            if p not in image_paths:
-                image_paths.append(p)
-                img_list.insert(tk.END, os.path.basename(p))
+        new = [p for p in dict.fromkeys(paths) if p not in image_paths_set]
+        if new:
+            image_paths.extend(new)
+            image_paths_set.update(new)
+            # One Tcl call for the whole selection
+            img_list.insert(tk.END, *(os.path.basename(p) for p in new))
 
     add_img_btn = tk.Button(scroll_frame, text="Add Images", command=add_images)
     add_img_btn.pack(pady=2)
 
     def add_docs():
         paths = filedialog.askopenfilenames(title="Select text docs")
-        for p in paths:
-            if p not in doc_paths:
-                doc_paths.append(p)
-                doc_list.insert(tk.END, os.path.basename(p))
+        new = [p for p in dict.fromkeys(paths) if p not in doc_paths_set]
+        if new:
+            doc_paths.extend(new)
+            doc_paths_set.update(new)
+            # One Tcl call for the whole selection
+            doc_list.insert(tk.END, *(os.path.basename(p) for p in new))
 
     add_doc_btn = tk.Button(scroll_frame, text="Add Docs", command=add_docs)
     add_doc_btn.pack(pady=2)
@@ -455,27 +847,106 @@ def main():
     site_label = tk.Label(right_frame, text="")
     site_label.pack(anchor="w")
 
+    status_label = tk.Label(right_frame, text="", fg="#555555")
+    status_label.pack(anchor="w")
+
     SITE_INDEX = os.path.abspath(os.path.join("site-dir", "index.html"))
+    # Whether SITE_INDEX exists, refreshed only after a request finishes
+    site_index_exists: bool | None = None
+
+    def refresh_site_exists() -> bool:
+        nonlocal site_index_exists
+        site_index_exists = os.path.exists(SITE_INDEX)
+        return site_index_exists
+
+    # Number of conversation messages already shown in chat_history
+    rendered = 0
 
     def update_history():
+        """Append messages added since the last render to chat_history."""
+        nonlocal rendered
+        # Called on every progress poll; most polls have nothing new
+        if rendered == len(conversation):
+            return
         chat_history.config(state=tk.NORMAL)
-        chat_history.delete("1.0", tk.END)
-        for msg in conversation:
+        for msg in conversation[rendered:]:
             if not msg.get("content"):
                 continue
             role = msg.get("role", "")
             tag = "user" if role == "user" else "assistant"
             chat_history.insert(tk.END, msg["content"] + "\n\n", tag)
+        rendered = len(conversation)
+        chat_history.see(tk.END)
         chat_history.config(state=tk.DISABLED)
 
-    def open_site():
-        site_t = type_var.get()
+    # Request currently running on the MCP loop, if any
+    active_future: Future | None = None
+
+    def when_done(fut: Future, callback) -> None:
+        """Invoke ``callback(fut)`` on the Tk thread once ``fut`` finishes.
+
+        While waiting, progress messages and finished build steps are shown.
+        """
+        nonlocal active_future
+        active_future = fut
+        latest = ""
+        while not progress_updates.empty():
+            latest = progress_updates.get_nowait()
+        if latest:
+            status_label.config(text=latest)
+        update_history()
+        if fut.done():
+            active_future = None
+            status_label.config(text="Cancelled" if fut.cancelled() else "")
+            callback(fut)
+        else:
+            root.after(100, when_done, fut, callback)
+
+    def cancel_request():
+        if active_future is not None:
+            active_future.cancel()
+
+    def set_busy(busy: bool) -> None:
+        # Run, Send and Reset share the conversation, so only one may be in
+        # flight and it must not be cleared under a running job
+        state = tk.DISABLED if busy else tk.NORMAL
+        run_btn.config(state=state)
+        send_btn.config(state=state)
+        reset_btn.config(state=state)
+        cancel_btn.config(state=tk.NORMAL if busy else tk.DISABLED)
+
+    def show_site(site_t: str) -> None:
         if site_t == "react":
-            ensure_react_env()
+            site_label.config(text=f"Site: http://localhost:{DEV_SERVER_PORT}")
             start_vite_server()
             webbrowser.open(f"http://localhost:{DEV_SERVER_PORT}")
+        elif site_index_exists:
+            site_label.config(text=f"Site: {SITE_INDEX}")
+            webbrowser.open("file://" + SITE_INDEX)
+
+    def open_site():
+        site_t = type_var.get()
+        if site_t == "react":
+            # A cold create-vite or npm install must not freeze the UI
+            set_busy(True)
+
+            def finish(fut: Future) -> None:
+                set_busy(False)
+                if fut.cancelled():
+                    return
+                try:
+                    warning = fut.result()
+                except Exception as exc:
+                    messagebox.showerror("React setup failed", str(exc))
+                    return
+                if warning:
+                    messagebox.showwarning(*warning)
+                start_vite_server()
+                webbrowser.open(f"http://localhost:{DEV_SERVER_PORT}")
+
+            when_done(mcp_client.submit(prepare_site(site_t)), finish)
         else:
-            if os.path.exists(SITE_INDEX):
+            if site_index_exists or refresh_site_exists():
                 webbrowser.open("file://" + SITE_INDEX)
             else:
                 messagebox.showinfo("No site", "index.html not found")
@@ -494,64 +965,65 @@ def main():
             )
             return
         site_t = type_var.get()
-        parts = [f"Business name: {name}" if name else "", desc]
+        parts = []
+        if name:
+            parts.append(f"Business name: {name}")
+        parts.append(desc)
         if style:
             parts.append(f"Design style: {style}")
         if colors:
             parts.append(f"Color scheme: {colors}")
         if extra:
             parts.append(f"Additional instructions: {extra}")
-        if image_paths:
-            img_names = []
-            os.makedirs(UPLOAD_DIR, exist_ok=True)
-            for path in image_paths:
-                dst = os.path.join(UPLOAD_DIR, os.path.basename(path))
-                try:
-                    shutil.copy(path, dst)
-                    img_names.append(os.path.basename(path))
-                except OSError:
-                    pass
+        images, docs = list(image_paths), list(doc_paths)
+        iterations = iter_var.get()
+        set_busy(True)
+
+        async def gather_io(fn, paths: list[str]) -> list:
+            futs = [asyncio.wrap_future(_io_pool.submit(fn, p)) for p in paths]
+            return await asyncio.gather(*futs, return_exceptions=True)
+
+        async def job() -> tuple[str, str] | None:
+            # Upload copies, snippet reads, npm setup and the build all run
+            # off the Tk thread; the copies and reads overlap on the I/O pool
+            img_names, _, snippets = await asyncio.gather(
+                gather_io(store_image, images),
+                gather_io(store_doc, docs),
+                gather_io(read_doc_snippet, docs),
+            )
+            img_names = [n for n in img_names if not isinstance(n, BaseException)]
             if img_names:
                 parts.append("Uploaded images: " + ", ".join(img_names))
-
-        if doc_paths:
-            doc_texts = []
-            os.makedirs(DOCS_DIR, exist_ok=True)
-            for path in doc_paths:
-                dst = os.path.join(DOCS_DIR, os.path.basename(path))
-                try:
-                    shutil.copy(path, dst)
-                except OSError:
-                    pass
-                try:
-                    with open(path, "r", encoding="utf-8") as fh:
-                        txt = fh.read()
-                    if len(txt) > 2000:
-                        txt = txt[:2000]
-                    doc_texts.append(f"{os.path.basename(path)}:\n{txt}")
-                except (OSError, UnicodeDecodeError):
-                    pass
+            doc_texts = [
+                f"{os.path.basename(path)}:\n{text}"
+                for path, text in zip(docs, snippets)
+                if not isinstance(text, BaseException)
+            ]
             if doc_texts:
                 parts.append("Guideline docs:\n" + "\n\n".join(doc_texts))
-
-        if site_t == "react":
-            parts.append("Project type: React")
-            ensure_react_env()
-        final_prompt = " \n".join(p for p in parts if p)
-        iterations = iter_var.get()
-        run_btn.config(state=tk.DISABLED)
-        try:
-            anyio.run(auto_build, final_prompt, iterations, site_t)
-            update_history()
             if site_t == "react":
-                site_label.config(text=f"Site: http://localhost:{DEV_SERVER_PORT}")
-                start_vite_server()
-                webbrowser.open(f"http://localhost:{DEV_SERVER_PORT}")
-            elif os.path.exists(SITE_INDEX):
-                site_label.config(text=f"Site: {SITE_INDEX}")
-                webbrowser.open("file://" + SITE_INDEX)
-        finally:
-            run_btn.config(state=tk.NORMAL)
+                parts.append("Project type: React")
+            warning = await prepare_site(site_t)
+            await auto_build(" \n".join(parts), iterations, site_t)
+            # Builds are the only thing that create index.html, so stat it
+            # here on the worker rather than on the Tk thread
+            refresh_site_exists()
+            return warning
+
+        def finish(fut: Future) -> None:
+            set_busy(False)
+            if fut.cancelled():
+                return
+            try:
+                warning = fut.result()
+            except Exception as exc:
+                messagebox.showerror("Build failed", str(exc))
+                return
+            if warning:
+                messagebox.showwarning(*warning)
+            show_site(site_t)
+
+        when_done(mcp_client.submit(job()), finish)
 
     run_btn = tk.Button(scroll_frame, text="Run", command=run_prompt)
     run_btn.pack(pady=5)
@@ -563,32 +1035,49 @@ def main():
         msg = chat_entry.get("1.0", tk.END).strip()
         if not msg:
             return
-        send_btn.config(state=tk.DISABLED)
-        try:
-            if site_t == "react":
-                ensure_react_env()
-            anyio.run(call_compound_tool, msg, site_t)
+        set_busy(True)
+
+        async def job() -> tuple[str, str] | None:
+            warning = await prepare_site(site_t)
+            await call_compound_tool(msg, site_t)
+            refresh_site_exists()
+            return warning
+
+        def finish(fut: Future) -> None:
+            set_busy(False)
+            if fut.cancelled():
+                return
+            try:
+                warning = fut.result()
+            except Exception as exc:
+                messagebox.showerror("Request failed", str(exc))
+                return
             chat_entry.delete("1.0", tk.END)
-            update_history()
-            if site_t == "react":
-                site_label.config(text=f"Site: http://localhost:{DEV_SERVER_PORT}")
-                start_vite_server()
-                webbrowser.open(f"http://localhost:{DEV_SERVER_PORT}")
-            elif os.path.exists(SITE_INDEX):
-                site_label.config(text=f"Site: {SITE_INDEX}")
-                webbrowser.open("file://" + SITE_INDEX)
-        finally:
-            send_btn.config(state=tk.NORMAL)
+            if warning:
+                messagebox.showwarning(*warning)
+            show_site(site_t)
+
+        when_done(mcp_client.submit(job()), finish)
 
     send_btn = tk.Button(right_frame, text="Send", command=send_chat)
     send_btn.pack(pady=2)
 
+    cancel_btn = tk.Button(
+        right_frame, text="Cancel", command=cancel_request, state=tk.DISABLED
+    )
+    cancel_btn.pack(pady=2)
+
     open_btn = tk.Button(right_frame, text="Open Site", command=open_site)
     open_btn.pack(pady=2)
 
     def deploy_vercel():
         try:
-            subprocess.run(["vercel", "--prod"], cwd="site-dir", check=True)
+            subprocess.run(
+                ["vercel", "--prod"],
+                cwd="site-dir",
+                stdin=subprocess.DEVNULL,
+                check=True,
+            )
             messagebox.showinfo("Vercel", "Deployment complete")
         except Exception:
             messagebox.showwarning(
@@ -600,7 +1089,9 @@ def main():
     vercel_btn.pack(pady=2)
 
     def reset():
+        nonlocal rendered
         conversation.clear()
+        rendered = 0
         chat_history.config(state=tk.NORMAL)
         chat_history.delete("1.0", tk.END)
         chat_history.config(state=tk.DISABLED)
@@ -611,9 +1102,10 @@ def main():
     reset_btn.pack(pady=2)
 
     def on_close():
-        server.terminate()
-        if vite_process and vite_process.poll() is None:
-            vite_process.terminate()
+        mcp_client.close()
+        stop_process(server)
+        if vite_process:
+            stop_process(vite_process)
         root.destroy()
 
     root.protocol("WM_DELETE_WINDOW", on_close)
@@ -1,15 +1,35 @@
 try:
     from mcp.server import FastMCP
+    from mcp.server.fastmcp import Context
 except ModuleNotFoundError as exc:
     raise ModuleNotFoundError(
         "Required package 'fastmcp' is missing. Install dependencies with 'pip install -r requirements.txt' before running the server."
     ) from exc
 from pydantic import BaseModel, Field
-import subprocess, os, json, textwrap, platform, difflib, time
-from groq import AsyncGroq
-import google.generativeai as genai
+import subprocess, os, json, textwrap, time, hashlib, mmap, re
+from collections import OrderedDict
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import atexit
+import signal
+import threading
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib json module is used instead
+    orjson = None
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # optional; list_files rescans the sandbox without it
+    Observer = None
+    FileSystemEventHandler = object
+
 from dotenv import load_dotenv
 from embedding_manager import EmbeddingManager
+from react_template import CACHE_DIR, create_react_project
 
 # Load environment variables from a local .env file so the Groq API key
 # can be provided without exporting it globally.
@@ -30,21 +50,35 @@ SANDBOX = os.path.abspath(os.path.join(os.path.dirname(__file__), "site-dir"))
 
 # Embedding manager for tracking file embeddings
 EMBED_MANAGER = EmbeddingManager(SANDBOX)
+# Direct write_file calls over MCP only queue their update; embed whatever is
+# still queued before the server exits
+atexit.register(lambda: EMBED_MANAGER.flush())
 
 
-def check_node_version(min_major: int = 20) -> tuple[bool, str]:
-    """Return (True, version) if Node.js meets the required major version."""
+@functools.lru_cache(maxsize=1)
+def _node_version(path_env: str | None) -> str | None:
+    """Return the ``node --version`` output for ``path_env``, or None."""
     try:
         result = subprocess.run(
             ["node", "--version"],
+            stdin=subprocess.DEVNULL,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
             check=True,
         )
-        ver = result.stdout.strip().lstrip("v")
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip().lstrip("v")
+
+
+def check_node_version(min_major: int = 20) -> tuple[bool, str]:
+    """Return (True, version) if Node.js meets the required major version."""
+    # The probe is cached per PATH so repeated React inits skip the fork.
+    ver = _node_version(os.environ.get("PATH"))
+    try:
         major = int(ver.split(".")[0])
-    except (FileNotFoundError, ValueError, subprocess.CalledProcessError):
+    except (AttributeError, ValueError):
         return False, "Node.js not found"
     return (major >= min_major, f"v{ver}")
 
@@ -68,51 +102,254 @@ class PathArg(BaseModel):
 
 
 WRITE_LOG = os.path.join(SANDBOX, "write_log.txt")
+# The log stays open with a large buffer and is flushed and synced every
+# WRITE_LOG_SYNC_EVERY entries (and at exit) instead of reopened per write.
+WRITE_LOG_SYNC_EVERY = 32
+_write_log_fh = None
+_write_log_pending = 0
+
+
+def _sync_write_log() -> None:
+    global _write_log_pending
+    if _write_log_fh is None:
+        return
+    _write_log_fh.flush()
+    os.fsync(_write_log_fh.fileno())
+    _write_log_pending = 0
+
+
+def _close_write_log() -> None:
+    global _write_log_fh
+    if _write_log_fh is None:
+        return
+    try:
+        _sync_write_log()
+        _write_log_fh.close()
+    except OSError:
+        pass
+    _write_log_fh = None
+
+
+def _append_write_log(entry: str) -> None:
+    """Append ``entry`` to WRITE_LOG through the shared buffered handle."""
+    global _write_log_fh, _write_log_pending
+    if _write_log_fh is None:
+        _write_log_fh = open(WRITE_LOG, "a", encoding="utf-8", buffering=1 << 16)
+    _write_log_fh.write(entry)
+    _write_log_pending += 1
+    if _write_log_pending >= WRITE_LOG_SYNC_EVERY:
+        _sync_write_log()
+        if not os.path.exists(WRITE_LOG):
+            # site-dir was cleared; start a fresh log on the next write
+            _close_write_log()
+
+
+atexit.register(_close_write_log)
+# Larger rewrites are logged as a size change; line diffs of big generated
+# bundles are slow and rarely useful to the model.
+MAX_DIFF_CHARS = 64 * 1024
+
+
+def _describe_change(old: str, new: str) -> str:
+    """Return a unified diff of ``old`` and ``new`` or, if large, a size note."""
+    if old == new:
+        return ""
+    if max(len(old), len(new)) > MAX_DIFF_CHARS:
+        return f"[{len(old)} -> {len(new)} characters; diff omitted]"
+    import difflib
+
+    return "\n".join(
+        difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="")
+    )
+
+
+# (mtime_ns, size, blake2b digest) of each file as write_file last left it,
+# so rewriting identical content is detected without reading the file.
+_written_hashes: dict[str, tuple[int, int, bytes]] = {}
+
+
+def _file_state(full: str, digest: bytes) -> tuple[int, int, bytes] | None:
+    try:
+        st = os.stat(full)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, digest)
 
 
 @app.tool(name="write_file", description="Create or overwrite a text file")
 def write_file(path: PathArg, content: str) -> str:
     full = sandbox_path(path.path)
+    data = content.encode("utf-8")
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    state = _file_state(full, digest)
+    if state is not None and _written_hashes.get(full) == state:
+        return f"unchanged {path.path}"
     os.makedirs(os.path.dirname(full), exist_ok=True)
     old = ""
-    if os.path.exists(full):
+    if state is not None:
         try:
             with open(full, "r", encoding="utf-8") as fh:
                 old = fh.read()
-        except OSError:
+        except (OSError, UnicodeDecodeError):
             old = ""
-    with open(full, "w", encoding="utf-8") as fh:
-        fh.write(content)
-    EMBED_MANAGER.update_file(path.path)
-    diff = "\n".join(
-        difflib.unified_diff(old.splitlines(), content.splitlines(), lineterm="")
-    )
+        if old == content:
+            _written_hashes[full] = state
+            return f"unchanged {path.path}"
+    # Write a sibling temp file and rename it over the target, so readers such
+    # as the dev server never see a half-written file.
+    tmp_path = f"{full}.tmp"
+    try:
+        with open(tmp_path, "wb", buffering=1 << 20) as fh:
+            fh.write(data)
+        os.replace(tmp_path, full)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _written_hashes[full] = _file_state(full, digest)
+    _index_add(path.path)
+    # Embedded in one batch when the compound_tool turn finishes
+    EMBED_MANAGER.queue_update(path.path)
+    diff = _describe_change(old, content)
     timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
     try:
-        with open(WRITE_LOG, "a", encoding="utf-8") as log:
-            log.write(f"{timestamp} {path.path}\n{diff}\n\n")
+        _append_write_log(f"{timestamp} {path.path}\n{diff}\n\n")
     except OSError:
         pass
     summary = "created" if not old else "updated"
     return f"{summary} {path.path}\n{diff[:1000]}"
 
 
+# Characters returned by read_file. Anything longer would not fit the model's
+# context anyway, so the rest of the file is never read or decoded.
+MAX_READ_CHARS = 256 * 1024
+
+
 @app.tool(name="read_file", description="Read a text file")
 def read_file(path: PathArg) -> str:
     full = sandbox_path(path.path)
     with open(full, encoding="utf-8") as fh:
-        return fh.read()
+        text = fh.read(MAX_READ_CHARS)
+        if not fh.read(1):
+            return text
+    size = os.path.getsize(full)
+    return f"{text}\n[truncated: file is {size} bytes]"
 
 
-@app.tool(name="list_files", description="List sandbox dir")
-def list_files() -> list[str]:
+def _walk_files(top: str) -> list[str]:
+    """Return the paths of all files under ``top`` using one scandir per dir.
+
+    Like ``os.walk``, symlinked directories are not descended into.
+    """
     out: list[str] = []
-    for root, _, files in os.walk(SANDBOX):
-        for f in files:
-            out.append(os.path.relpath(os.path.join(root, f), SANDBOX))
+    stack = [top]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                else:
+                    out.append(entry.path)
     return out
 
 
+# Relative paths of all sandbox files. Only kept while a watchdog observer
+# reports changes made by other processes; None means rescan on next use.
+_file_index: set[str] | None = None
+# Bumped on every change; a rescan that saw it move may have missed events
+_file_index_gen = 0
+_file_index_lock = threading.Lock()
+_observer = None
+
+
+def _sandbox_rel(path: str) -> str | None:
+    if path.startswith(SANDBOX + os.sep):
+        return path[len(SANDBOX) + 1 :]
+    return None
+
+
+def _index_add(rel: str) -> None:
+    global _file_index_gen
+    with _file_index_lock:
+        _file_index_gen += 1
+        if _file_index is not None:
+            _file_index.add(os.path.normpath(rel))
+
+
+def _invalidate_file_index() -> None:
+    global _file_index, _file_index_gen
+    with _file_index_lock:
+        _file_index_gen += 1
+        _file_index = None
+
+
+class _IndexUpdater(FileSystemEventHandler):
+    """Apply sandbox file events to ``_file_index``."""
+
+    def on_any_event(self, event) -> None:
+        global _file_index, _file_index_gen
+        with _file_index_lock:
+            _file_index_gen += 1
+            if _file_index is None:
+                return
+            kind = event.event_type
+            if event.is_directory:
+                # Files inside a new or moved directory may predate its watch
+                if kind in ("created", "deleted", "moved"):
+                    _file_index = None
+                return
+            src = _sandbox_rel(event.src_path)
+            if kind in ("deleted", "moved"):
+                _file_index.discard(src)
+            if kind == "created" and src:
+                _file_index.add(src)
+            elif kind == "moved":
+                dest = _sandbox_rel(event.dest_path)
+                if dest:
+                    _file_index.add(dest)
+
+
+def start_file_watcher() -> None:
+    """Keep ``list_files`` answers in memory if watchdog is available."""
+    global _observer
+    if Observer is None or _observer is not None:
+        return
+    observer = Observer()
+    observer.daemon = True
+    try:
+        observer.schedule(_IndexUpdater(), SANDBOX, recursive=True)
+        observer.start()
+    except OSError:
+        # e.g. the inotify watch limit; fall back to rescanning
+        return
+    _observer = observer
+
+
+@app.tool(name="list_files", description="List sandbox dir")
+def list_files() -> list[str]:
+    global _file_index
+    with _file_index_lock:
+        if _file_index is not None:
+            return sorted(_file_index)
+        gen = _file_index_gen
+    # Every path starts with SANDBOX + os.sep, so slicing replaces relpath
+    prefix = len(SANDBOX) + 1
+    files = [p[prefix:] for p in _walk_files(SANDBOX)]
+    if _observer is not None and _observer.is_alive():
+        with _file_index_lock:
+            # Only keep the scan if no event arrived while it ran
+            if _file_index_gen == gen:
+                _file_index = set(files)
+    return sorted(files)
+
+
 class Cmd(BaseModel):
     cmd: str = Field(..., description="Shell cmd run inside ./site-dir")
 
@@ -121,24 +358,82 @@ class SearchQuery(BaseModel):
     query: str = Field(..., description="Terms to search for in ./site-dir/docs")
 
 
+# run_cmd keeps only the last this-many bytes of output; the tail is where
+# errors and summaries appear, and chatty commands cannot grow memory.
+RUN_CMD_OUTPUT_BYTES = 4096
+RUN_CMD_TIMEOUT = 30
+
+
+def _kill_process_tree(proc: subprocess.Popen) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
 @app.tool(name="run_cmd", description="Run shell command (e.g. python main.py)")
 def run_cmd(arg: Cmd) -> str:
     """Execute a shell command in the sandbox and return its output."""
+    proc = subprocess.Popen(
+        arg.cmd,
+        cwd=SANDBOX,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        # Own process group so a timeout also stops the command's children
+        start_new_session=True,
+    )
+    tail = bytearray()
+
+    def drain() -> None:
+        for chunk in iter(lambda: proc.stdout.read1(65536), b""):
+            tail.extend(chunk)
+            del tail[:-RUN_CMD_OUTPUT_BYTES]
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    timed_out = False
     try:
-        proc = subprocess.run(
-            arg.cmd,
-            cwd=SANDBOX,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            timeout=30,
-            check=False,
-        )
-        output = proc.stdout
-    except subprocess.TimeoutExpired as exc:
-        output = (exc.stdout or "") + (exc.stderr or "") + "\n<timeout>"
-    return output[:4096]
+        proc.wait(timeout=RUN_CMD_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        _kill_process_tree(proc)
+        proc.wait()
+    reader.join(timeout=5)
+    output = tail.decode("utf-8", "replace")
+    if timed_out:
+        output += "\n<timeout>"
+    # Commands can create or delete many files at once
+    _invalidate_file_index()
+    return output
+
+
+# Docs are read concurrently so slow disks overlap their waits
+_docs_pool = ThreadPoolExecutor(max_workers=16)
+
+
+def _doc_matches(full: str, query: str, pattern) -> str | None:
+    """Return the first 2000 characters of ``full`` if it contains ``query``.
+
+    ASCII queries are matched with ``pattern`` directly on an mmap of the
+    file, so the text is neither decoded nor lower-cased in full.
+    """
+    with open(full, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if pattern is None or size == 0:
+            text = fh.read().decode("utf-8", "replace")
+            return text[:2000] if query in text.lower() else None
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            if pattern.search(mm) is None:
+                return None
+            # 2000 characters never take more than 8000 bytes of UTF-8
+            return mm[:8000].decode("utf-8", "replace")[:2000]
 
 
 @app.tool(name="search_docs", description="Search guideline docs for text")
@@ -148,25 +443,30 @@ def search_docs(arg: SearchQuery) -> str:
     query = arg.query.lower()
     if not os.path.exists(docs_dir):
         return ""
-    for root, _, files in os.walk(docs_dir):
-        for f in files:
-            if not f.lower().endswith((".txt", ".md")):
-                continue
-            full = os.path.join(root, f)
-            try:
-                with open(full, "r", encoding="utf-8") as fh:
-                    text = fh.read()
-            except OSError:
-                continue
-            if query in text.lower():
-                snippet = text[:2000]
-                results.append(f"{f}:\n{snippet}")
+    pattern = None
+    if query.isascii():
+        pattern = re.compile(re.escape(query.encode("ascii")), re.IGNORECASE)
+
+    def match(full: str) -> str | None:
+        try:
+            return _doc_matches(full, query, pattern)
+        except (OSError, ValueError):
+            return None
+
+    paths = sorted(
+        p for p in _walk_files(docs_dir) if p.lower().endswith((".txt", ".md"))
+    )
+    for full, snippet in zip(paths, _docs_pool.map(match, paths)):
+        if snippet is not None:
+            results.append(f"{os.path.basename(full)}:\n{snippet}")
     return "\n\n".join(results)[:4096]
 
 
 # New tool: return basic OS information
 @app.tool(name="get_os", description="Get operating system info")
 def get_os() -> str:
+    import platform
+
     return platform.platform()
 
 
@@ -180,196 +480,332 @@ def init_react_project() -> str:
     if os.path.exists(pkg):
         return "React project already initialized"
     try:
-        subprocess.run(
-            [
-                "npm",
-                "exec",
-                "--yes",
-                "create-vite@latest",
-                ".",
-                "--",
-                "--template",
-                "react",
-            ],
-            cwd=SANDBOX,
-            check=True,
-        )
-        subprocess.run(["npm", "install"], cwd=SANDBOX, check=True)
+        create_react_project(SANDBOX)
+        _invalidate_file_index()
         return "React environment ready"
     except Exception as exc:
         return f"Failed to set up React: {exc}"
 
 
-TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "write_file",
-            "description": "Create or overwrite a text file",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string"},
-                    "content": {"type": "string"},
-                },
-                "required": ["path", "content"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "read_file",
-            "description": "Read a text file",
-            "parameters": {
-                "type": "object",
-                "properties": {"path": {"type": "string"}},
-                "required": ["path"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "list_files",
-            "description": "List sandbox dir",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "run_cmd",
-            "description": "Run shell command (e.g. python main.py)",
-            "parameters": {
-                "type": "object",
-                "properties": {"cmd": {"type": "string"}},
-                "required": ["cmd"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "search_docs",
-            "description": "Search guideline docs for text",
-            "parameters": {
-                "type": "object",
-                "properties": {"query": {"type": "string"}},
-                "required": ["query"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_os",
-            "description": "Get operating system info",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
+class WriteArgs(PathArg):
+    content: str = Field(..., description="Full text to store in the file")
+
+
+class NoArgs(BaseModel):
+    pass
+
+
+def _tool_spec(name: str, desc: str, model: type[BaseModel]) -> dict:
+    return {
         "type": "function",
         "function": {
-            "name": "init_react_project",
-            "description": "Create React environment in site-dir",
-            "parameters": {"type": "object", "properties": {}},
+            "name": name,
+            "description": desc,
+            "parameters": model.model_json_schema(),
         },
-    },
-]
+    }
+
+
+# Tools offered to Groq: (name, description, argument model, handler). The
+# handler receives the arguments already validated by the same model the
+# schema is generated from, so the two cannot drift apart.
+_TOOL_TABLE = (
+    (
+        "write_file",
+        "Create or overwrite a text file",
+        WriteArgs,
+        lambda a: write_file(a, a.content),
+    ),
+    ("read_file", "Read a text file", PathArg, read_file),
+    ("list_files", "List sandbox dir", NoArgs, lambda a: list_files()),
+    ("run_cmd", "Run shell command (e.g. python main.py)", Cmd, run_cmd),
+    ("search_docs", "Search guideline docs for text", SearchQuery, search_docs),
+    ("get_os", "Get operating system info", NoArgs, lambda a: get_os()),
+    (
+        "init_react_project",
+        "Create React environment in site-dir",
+        NoArgs,
+        lambda a: init_react_project(),
+    ),
+)
+
+# Tool schemas sent with every Groq request, generated once from the argument
+# models. Kept as a tuple so nothing can mutate them between calls and the
+# serialized prefix stays byte-identical.
+TOOLS = tuple(_tool_spec(name, desc, model) for name, desc, model, _ in _TOOL_TABLE)
+
+# Argument model and handler for each Groq tool call, keyed by tool name.
+# Tools in _THREADED_TOOLS only touch the filesystem or a subprocess, so they
+# run in a worker thread to keep the event loop free. write_file stays on the
+# loop: its embedding update is only queued, but it shares the buffered write
+# log and _written_hashes, which are not locked.
+_TOOL_DISPATCH = {name: (model, handler) for name, _, model, handler in _TOOL_TABLE}
+_THREADED_TOOLS = frozenset(
+    {"list_files", "run_cmd", "search_docs", "init_react_project"}
+)
+
+
+# Rough prompt budget per compound_tool call. Tokens are estimated as four
+# characters each, which is close enough for windowing purposes.
+MAX_PROMPT_TOKENS = 6000
+MAX_MESSAGE_CHARS = 8000
+# Old messages are dropped in blocks of this many so the start of the prompt
+# stays byte-identical for several turns and provider prefix caches can hit.
+TRIM_STEP = 4
+
+
+def trim_messages(
+    messages: list[dict], max_tokens: int = MAX_PROMPT_TOKENS
+) -> list[dict]:
+    """Return the most recent messages that fit in ``max_tokens``.
+
+    A leading system prompt and the first user message (the brief or spec)
+    are always kept, oversized messages are truncated and any dropped turns
+    after them are replaced by a short note.
+    """
+    if not messages:
+        return []
+    pinned = 1 if messages[0].get("role") == "system" else 0
+    if len(messages) > pinned and messages[pinned].get("role") == "user":
+        pinned += 1
+    shortened = []
+    for msg in messages:
+        content = msg.get("content") or ""
+        if len(content) > MAX_MESSAGE_CHARS:
+            content = content[:MAX_MESSAGE_CHARS] + "\n[truncated]"
+            msg = {**msg, "content": content}
+        shortened.append(msg)
+    head, rest = shortened[:pinned], shortened[pinned:]
+    if not rest:
+        return head
+    costs = [len(m.get("content") or "") // 4 for m in rest]
+    total = sum(costs) + sum(
+        len(m.get("content") or "") // 4 for m in head if m.get("role") != "system"
+    )
+    cut = 0
+    while cut < len(rest) - 1 and total > max_tokens:
+        total -= costs[cut]
+        cut += 1
+    if cut:
+        cut = min(-(-cut // TRIM_STEP) * TRIM_STEP, len(rest) - 1)
+    dropped, tail = rest[:cut], rest[cut:]
+    if dropped:
+        replies = sum(1 for m in dropped if m.get("role") == "assistant")
+        note = (
+            f"[{len(dropped)} earlier messages omitted, including {replies} of "
+            "your replies. Files written in those turns are still in the sandbox; "
+            "use list_files and read_file to inspect them.]"
+        )
+        head = head + [{"role": "user", "content": note}]
+    return head + tail
 
 
-async def _run_groq(messages: list[dict], model: str) -> str:
-    """Run the conversation using Groq LLM with OpenAI-style tool calling."""
+# One Groq client per event loop so its HTTP connection pool (and TLS
+# sessions) is shared by every compound_tool call instead of rebuilt each time.
+# The provider SDKs are imported on first use, so a server that only talks to
+# one provider never loads the other.
+_groq_client_cache: tuple | None = None
+# Bounds for each Groq HTTP request, applied by the SDK so a retry repeats
+# only the failed request and never a whole agent turn with its tool calls.
+GROQ_TIMEOUT = 60.0
+GROQ_MAX_RETRIES = 3
+
+
+def _groq_client():
+    global _groq_client_cache
+    loop = asyncio.get_running_loop()
+    if _groq_client_cache is None or _groq_client_cache[0] is not loop:
+        from groq import AsyncGroq
+
+        client = AsyncGroq(
+            api_key=GROQ_API_KEY, timeout=GROQ_TIMEOUT, max_retries=GROQ_MAX_RETRIES
+        )
+        _groq_client_cache = (loop, client)
+    return _groq_client_cache[1]
+
+
+@functools.lru_cache(maxsize=1)
+def _genai():
+    import google.generativeai as genai
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+
+def _load_args(raw: str) -> dict:
+    """Decode a tool call's JSON arguments, treating bad input as no args."""
+    if not raw:
+        return {}
+    try:
+        args = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError:
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
+async def _execute_tool_call(call: dict, on_step=None):
+    """Run one assembled tool call and return its result."""
+    name = call["function"]["name"]
+    args = _load_args(call["function"]["arguments"])
+    spec = _TOOL_DISPATCH.get(name)
+    if spec is None:
+        result = f"Unknown tool: {name}"
+    else:
+        model, handler = spec
+        try:
+            # Bad arguments (including a path outside the sandbox) become an
+            # error result the model can correct instead of ending the turn
+            parsed = model.model_validate(args)
+            if name in _THREADED_TOOLS:
+                result = await asyncio.to_thread(handler, parsed)
+            else:
+                result = handler(parsed)
+        except ValueError as exc:
+            result = f"Error: {exc}"
+    if on_step:
+        await on_step(f"{name} {args.get('path', '')}".strip())
+    return result
+
+
+async def _run_tool_calls(ready: asyncio.Queue, on_step=None) -> list:
+    """Execute tool calls from ``ready`` in order until a None sentinel."""
+    results = []
+    while (call := await ready.get()) is not None:
+        results.append(await _execute_tool_call(call, on_step))
+    return results
+
+
+# Tool result for a call whose arguments were cut off by the output limit
+TRUNCATED_CALL_RESULT = (
+    "Error: the output limit was reached before this call's arguments were "
+    "complete, so it was not run. Send it again with shorter arguments."
+)
+
+
+async def _run_groq(
+    messages: list[dict],
+    model: str,
+    max_output_tokens: int | None = None,
+    on_step=None,
+    tools: bool = True,
+) -> str:
+    """Run the conversation using Groq LLM with OpenAI-style tool calling.
+
+    Responses are streamed, and each tool call starts as soon as the model
+    moves on to the next one, so tools run while the rest of the reply is
+    still being generated. ``on_step`` is awaited with a short description
+    of each tool call so callers can report progress while the agent works.
+    A call cut off by ``max_output_tokens`` is not run; the model gets an
+    error result for it instead. With ``tools=False`` no tools are offered
+    and the reply is plain text.
+    """
     if not GROQ_API_KEY:
         raise RuntimeError("GROQ_API_KEY environment variable not set.")
-    client = AsyncGroq(api_key=GROQ_API_KEY)
+    client = _groq_client()
 
     conversation = messages[:]
+    extra = {"max_tokens": max_output_tokens} if max_output_tokens else {}
+    if tools:
+        extra.update(tools=TOOLS, tool_choice="auto")
 
     while True:
-        response = await client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model=model,
             messages=conversation,
-            tools=TOOLS,
-            tool_choice="auto",
+            stream=True,
+            **extra,
         )
 
-        message = response.choices[0].message
-        if message.tool_calls:
+        content: list[str] = []
+        calls: list[dict] = []
+        finish_reason = None
+        ready: asyncio.Queue = asyncio.Queue()
+        runner = asyncio.create_task(_run_tool_calls(ready, on_step))
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+                delta = choice.delta
+                if delta.content:
+                    content.append(delta.content)
+                # Tool calls arrive as fragments keyed by index; a new index
+                # means the previous call's arguments are complete.
+                for part in delta.tool_calls or ():
+                    if part.index >= len(calls):
+                        if calls:
+                            ready.put_nowait(calls[-1])
+                        calls.append(
+                            {
+                                "id": "",
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""},
+                            }
+                        )
+                    call = calls[part.index]
+                    if part.id:
+                        call["id"] = part.id
+                    if part.function is not None:
+                        call["function"]["name"] += part.function.name or ""
+                        call["function"]["arguments"] += part.function.arguments or ""
+        except BaseException:
+            runner.cancel()
+            raise
+        # The last call's arguments are complete unless the output limit hit
+        truncated = bool(calls) and finish_reason == "length"
+        if calls and not truncated:
+            ready.put_nowait(calls[-1])
+        ready.put_nowait(None)
+        results = await runner
+        if truncated:
+            results.append(TRUNCATED_CALL_RESULT)
+
+        if not calls:
+            return "".join(content)
+        conversation.append({"role": "assistant", "content": None, "tool_calls": calls})
+        for call, result in zip(calls, results):
             conversation.append(
-                {
-                    "role": "assistant",
-                    "content": None,
-                    "tool_calls": [c.model_dump() for c in message.tool_calls],
-                }
+                {"role": "tool", "tool_call_id": call["id"], "content": result}
             )
-            for call in message.tool_calls:
-                try:
-                    args = json.loads(call.function.arguments or "{}")
-                except json.JSONDecodeError:
-                    args = {}
-
-                if call.function.name == "write_file":
-                    result = write_file(
-                        PathArg(path=args.get("path", "")), args.get("content", "")
-                    )
-                elif call.function.name == "read_file":
-                    result = read_file(PathArg(path=args.get("path", "")))
-                elif call.function.name == "list_files":
-                    result = list_files()
-                elif call.function.name == "run_cmd":
-                    result = run_cmd(Cmd(cmd=args.get("cmd", "")))
-                elif call.function.name == "search_docs":
-                    result = search_docs(SearchQuery(query=args.get("query", "")))
-                elif call.function.name == "get_os":
-                    result = get_os()
-                elif call.function.name == "init_react_project":
-                    result = init_react_project()
-                else:
-                    result = f"Unknown tool: {call.function.name}"
-
-                conversation.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": call.id,
-                        "content": result,
-                    }
-                )
-        else:
-            return message.content or ""
 
 
-async def _run_gemini(messages: list[dict], model: str) -> str:
+async def _run_gemini(
+    messages: list[dict],
+    model: str,
+    max_output_tokens: int | None = None,
+    tools: bool = True,
+) -> str:
     """Run the conversation using Google's Gemini models with function calls."""
     if not GEMINI_API_KEY:
         raise RuntimeError(
             "GEMINI_API_KEY or GOOGLE_API_KEY environment variable not set."
         )
 
-    genai.configure(api_key=GEMINI_API_KEY)
+    genai = _genai()
     history = [
         {"role": m["role"], "parts": [m.get("content", "")]}
         for m in messages[:-1]
         if m.get("content")
     ]
-    chat = genai.GenerativeModel(model).start_chat(
+    config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+    chat = genai.GenerativeModel(model, generation_config=config).start_chat(
         history=history,
-        enable_automatic_function_calling=True,
+        enable_automatic_function_calling=tools,
     )
 
     last = messages[-1]
+    functions = [
+        write_file,
+        read_file,
+        list_files,
+        run_cmd,
+        search_docs,
+        get_os,
+        init_react_project,
+    ]
     response = await chat.send_message_async(
-        last.get("content", ""),
-        tools=[
-            write_file,
-            read_file,
-            list_files,
-            run_cmd,
-            search_docs,
-            get_os,
-            init_react_project,
-        ],
+        last.get("content", ""), tools=functions if tools else None
     )
 
     content = response.candidates[0].content
@@ -377,16 +813,191 @@ async def _run_gemini(messages: list[dict], model: str) -> str:
     return "".join(text_parts)
 
 
+# Plain-text replies (tools=False) are cached outside the sandbox, keyed by
+# its path, so the entries never show up in list_files, read_file or a
+# deployment of site-dir. Tool-calling replies are never cached: replaying
+# one skips its write_file and run_cmd calls, which is wrong as soon as the
+# sandbox no longer holds what they produced.
+RESPONSE_CACHE_DIR = os.path.join(
+    CACHE_DIR,
+    "responses",
+    hashlib.sha256(SANDBOX.encode("utf-8")).hexdigest()[:16],
+)
+RESPONSE_CACHE_SIZE = 256
+# Recent responses are also kept in memory so repeats skip the disk
+RESPONSE_MEMO_SIZE = 64
+_response_memo: OrderedDict[str, str] = OrderedDict()
+
+
+def _remember_response(key: str, text: str) -> None:
+    _response_memo[key] = text
+    _response_memo.move_to_end(key)
+    while len(_response_memo) > RESPONSE_MEMO_SIZE:
+        _response_memo.popitem(last=False)
+
+
+def _response_cache_key(
+    messages: list[dict], model: str, max_output_tokens: int | None, tools: bool
+) -> str:
+    data = [model, max_output_tokens, tools, messages]
+    if orjson is not None:
+        try:
+            payload = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+            return hashlib.sha256(payload).hexdigest()
+        except TypeError:
+            pass
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _read_cached_response(key: str) -> str | None:
+    path = os.path.join(RESPONSE_CACHE_DIR, f"{key}.json")
+    try:
+        # Bump the mtime so eviction drops the least recently used entries
+        os.utime(path)
+        if key in _response_memo:
+            _response_memo.move_to_end(key)
+            return _response_memo[key]
+        with open(path, "r", encoding="utf-8") as fh:
+            text = json.load(fh)["response"]
+    except (OSError, ValueError, KeyError, TypeError):
+        _response_memo.pop(key, None)
+        return None
+    _remember_response(key, text)
+    return text
+
+
+def _write_cached_response(key: str, text: str) -> None:
+    _remember_response(key, text)
+    path = os.path.join(RESPONSE_CACHE_DIR, f"{key}.json")
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"response": text}, fh)
+        os.replace(tmp_path, path)
+        entries = [
+            os.path.join(RESPONSE_CACHE_DIR, f)
+            for f in os.listdir(RESPONSE_CACHE_DIR)
+            if f.endswith(".json")
+        ]
+        if len(entries) > RESPONSE_CACHE_SIZE:
+            entries.sort(key=os.path.getmtime)
+            for old in entries[: len(entries) - RESPONSE_CACHE_SIZE]:
+                os.remove(old)
+    except OSError:
+        pass
+
+
+# Requests currently being answered, by response cache key. Identical
+# concurrent requests share one model run instead of each calling the API.
+# The run is its own task, so it outlives any single caller, and
+# _inflight_waiters counts the callers still awaiting it.
+_inflight: dict[str, asyncio.Task] = {}
+_inflight_waiters: dict[str, int] = {}
+
+
+def _forget_inflight(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+        _inflight_waiters.pop(key, None)
+
+
+async def _generate_shared(key: str, cache: bool, *args) -> str:
+    text = await _generate(*args)
+    if text and cache:
+        _write_cached_response(key, text)
+    return text
+
+
+async def _generate(
+    messages: list[dict], model: str, max_output_tokens: int | None, tools: bool, ctx
+) -> str:
+    try:
+        return await _run_model(messages, model, max_output_tokens, tools, ctx)
+    finally:
+        # Embed everything write_file touched during the turn in one batch,
+        # off the event loop
+        await asyncio.to_thread(EMBED_MANAGER.flush)
+
+
+async def _run_model(
+    messages: list[dict], model: str, max_output_tokens: int | None, tools: bool, ctx
+) -> str:
+    if model.lower().startswith("gemini"):
+        return await _run_gemini(messages, model, max_output_tokens, tools)
+    on_step = None
+    if ctx is not None:
+        steps = 0
+
+        async def on_step(message: str) -> None:
+            nonlocal steps
+            steps += 1
+            try:
+                await ctx.report_progress(steps, None, message)
+            except Exception:
+                # The caller that owns ctx may have gone while others still
+                # share this run; progress is best effort
+                pass
+
+    return await _run_groq(messages, model, max_output_tokens, on_step, tools)
+
+
 @app.tool(
     name="compound_tool", description="Agent that uses an LLM to call other tools"
 )
 async def compound_tool(
-    messages: list[dict], model: str = "meta-llama/llama-4-maverick-17b-128e-instruct"
+    messages: list[dict],
+    model: str = "meta-llama/llama-4-maverick-17b-128e-instruct",
+    max_output_tokens: int | None = None,
+    tools: bool = True,
+    ctx: Context = None,
 ) -> str:
-    """Dispatch to Groq or Gemini depending on the model name."""
-    if model.lower().startswith("gemini"):
-        return await _run_gemini(messages, model)
-    return await _run_groq(messages, model)
+    """Dispatch to Groq or Gemini depending on the model name.
+
+    ``max_output_tokens`` caps each model response when set, and
+    ``tools=False`` asks for a plain reply with no tools offered. The history is
+    windowed with ``trim_messages`` so long sessions keep a bounded prompt,
+    and identical requests share the result of one still running. Replies
+    without tools are also answered from an on-disk response cache.
+    When called over MCP, each tool call is reported as a progress message.
+    """
+    messages = trim_messages(messages)
+    key = _response_cache_key(messages, model, max_output_tokens, tools)
+    cached = None if tools else _read_cached_response(key)
+    if cached is not None:
+        return cached
+    while True:
+        task = _inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(
+                _generate_shared(
+                    key, not tools, messages, model, max_output_tokens, tools, ctx
+                )
+            )
+            _inflight[key] = task
+            _inflight_waiters[key] = 0
+            task.add_done_callback(functools.partial(_forget_inflight, key))
+        _inflight_waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                # This caller went away; stop the run once nobody else waits
+                _inflight_waiters[key] -= 1
+                if not _inflight_waiters[key]:
+                    task.cancel()
+                raise
+            if not task.cancelled():
+                raise
+            # The shared run was cancelled under us; run the request again
+
+
+@functools.lru_cache(maxsize=1)
+def _gitignore_entries(path: str, mtime_ns: int) -> frozenset[str]:
+    # mtime_ns is only part of the cache key
+    with open(path, "r", encoding="utf-8") as fh:
+        return frozenset(line.rstrip("\n") for line in fh)
 
 
 def ensure_sandbox() -> None:
@@ -394,15 +1005,22 @@ def ensure_sandbox() -> None:
     os.makedirs(SANDBOX, exist_ok=True)
     ignore_entry = "site-dir/"
     gitignore = os.path.join(os.getcwd(), ".gitignore")
-    lines: list[str] = []
-    if os.path.exists(gitignore):
-        with open(gitignore, "r", encoding="utf-8") as fh:
-            lines = [line.rstrip("\n") for line in fh]
-    if ignore_entry not in lines:
-        with open(gitignore, "a", encoding="utf-8") as fh:
-            if lines and lines[-1] != "":
-                fh.write("\n")
-            fh.write(f"{ignore_entry}\n")
+    try:
+        st = os.stat(gitignore)
+    except FileNotFoundError:
+        st = None
+    if st is not None and ignore_entry in _gitignore_entries(
+        gitignore, st.st_mtime_ns
+    ):
+        return
+    with open(gitignore, "ab+") as fh:
+        entry = f"{ignore_entry}\n".encode()
+        if st is not None and st.st_size:
+            # Only the last byte matters for whether a newline is needed
+            fh.seek(-1, os.SEEK_END)
+            if fh.read(1) != b"\n":
+                entry = b"\n" + entry
+        fh.write(entry)
 
 
 def main() -> None:
@@ -421,6 +1039,7 @@ def main() -> None:
     args = parser.parse_args()
 
     ensure_sandbox()
+    start_file_watcher()
     banner = textwrap.dedent(
         f"""
         Running MCP web builder server